@@ -1,94 +1,310 @@
+import itertools
 import json
+import math
 import os
 import re
+import statistics
 import subprocess
 import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-LTS_FILE_NAME = "/tmp/benchmark.ccs"
 USE_PAIGE_TARJAN = True
+# sampling stops after the budget (in seconds) is spent, the relative standard
+# error drops below the target or MAX_SAMPLES is reached (warmup not counted)
+SAMPLE_BUDGET = 2.0
+TARGET_REL_STDERR = 0.05
+MIN_SAMPLES = 3
+MAX_SAMPLES = 50
+CACHE_FILE_NAME = "benchmark_cache.json"
+SERVER_DONE = "%done"
+TOOK_REGEX = re.compile(r"took (\d+\.?\d*\S*)")
+TIME_REGEX = re.compile(r"(\d+\.?\d*)(ns|\u00b5s|\u03bcs|ms|s)$")
+TIME_UNITS = {
+    "ns": 1e-9,
+    "\u00b5s": 1e-6,  # micro sign, as printed by Rust
+    "\u03bcs": 1e-6,  # greek small letter mu
+    "ms": 1e-3,
+    "s": 1.0,
+}
+# states to transitions ratios rendered by render_benchmark.py
+RATIOS = [(1, 1), (2, 1), (1, 2)]
+MODES = ["grid", "slices"]
+# each measurement runs a compute-heavy ccs process, so leave some headroom
+WORKERS = max(1, (os.cpu_count() or 1) // 2)
 
 
-def bench(binary: str, step_width: int, nsteps: int, use_pt: bool):
-    pt_times = []
-    for s in range(step_width, step_width * nsteps + 1, step_width):
-        for t in range(step_width, step_width * nsteps + 1, step_width):
-            pt = measure_time(binary, s, t, use_pt)
-            pt_times.append((s, t, pt))
-            print(f"finished {s}x{t}", file=sys.stderr)
+def grid_cells(step_width: int, nsteps: int) -> list[tuple[int, int]]:
+    steps = range(step_width, step_width * nsteps + 1, step_width)
+    return list(itertools.product(steps, steps))
 
-    return pt_times
+# only the cells that end up in the 2D diagrams of render_benchmark.py
+def slice_cells(step_width: int, nsteps: int) -> list[tuple[int, int]]:
+    maximum = step_width * nsteps
+    steps = range(step_width, maximum + 1, step_width)
+    fixed = [step_width, maximum // 2, maximum]
 
-def measure_time(binary: str, states: int, transitions: int, pt: bool) -> float:
-    subprocess.call(f"{binary} random-lts -s {states} -t {transitions} -a 1 >{LTS_FILE_NAME}", shell=True)
+    cells = set()
+    for n in steps:
+        for f in fixed:
+            cells.add((n, f))
+            cells.add((f, n))
+        for rstates, rtransitions in RATIOS:
+            if (rstates * n) % rtransitions == 0 and step_width <= rstates * n // rtransitions <= maximum:
+                cells.add((n, rstates * n // rtransitions))
 
+    return sorted(cells)
+
+def bench(binary: str, pairs: list[tuple[int, int]], use_pt: bool, write, cache: dict | None = None):
+    # every row is written as a single JSON line as soon as it is available
+    def emit(row):
+        write.write(json.dumps(row) + "\n")
+        write.flush()
+
+    if cache is not None:
+        measured = set()
+        for s, t in pairs:
+            key = cache_key(binary, s, t, use_pt)
+            if key in cache:
+                emit([s, t, *cache[key]])
+                measured.add((s, t))
+                print(f"cached {s}x{t}", file=sys.stderr)
+        pairs = [p for p in pairs if p not in measured]
+
+    # submit the most expensive cells first so no long cell is left running
+    # alone at the end of the run (longest-processing-time-first scheduling)
+    pairs = sorted(pairs, key=lambda p: p[0] * p[1], reverse=True)
+
+    # every worker thread keeps its own ccs server process for the whole run
+    servers = []
+    local = threading.local()
+
+    def worker(s: int, t: int):
+        if not hasattr(local, "server"):
+            local.server = start_server(binary)
+            servers.append(local.server)
+        return measure_time(binary, local.server, s, t, use_pt)
+
+    try:
+        with ThreadPoolExecutor(max_workers=WORKERS) as ex:
+            futures = {ex.submit(worker, s, t): (s, t) for s, t in pairs}
+            try:
+                for future in as_completed(futures):
+                    s, t = futures[future]
+                    stats = future.result()
+                    emit([s, t, *stats])
+                    if cache is not None:
+                        cache[cache_key(binary, s, t, use_pt)] = stats
+                        save_cache(cache)
+                    print(f"finished {s}x{t} ({stats[2]} samples)", file=sys.stderr)
+            except BaseException:
+                # a failed cell or Ctrl-C: don't measure the remaining cells
+                # only to throw them away
+                ex.shutdown(wait=False, cancel_futures=True)
+                raise
+    finally:
+        for server in servers:
+            stop_server(server)
+
+def load_results(filename: str) -> list:
+    if not os.path.exists(filename):
+        return []
+    with open(filename, "r") as read:
+        lines = read.readlines()
+
+    # an interrupted run may leave a partially written last line, cut it off so
+    # appended rows start on a line of their own
+    if lines and not is_complete_row(lines[-1]):
+        print(f"dropping incomplete last line of {filename}", file=sys.stderr)
+        lines.pop()
+        with open(filename, "w") as write:
+            write.writelines(lines)
+
+    return [json.loads(line) for line in lines if line.strip()]
+
+def is_complete_row(line: str) -> bool:
+    if not line.endswith("\n"):
+        return False
+    try:
+        json.loads(line)
+        return True
+    except json.JSONDecodeError:
+        return not line.strip()
+
+def algorithm_name(pt: bool) -> str:
     if pt:
-        algo = "paige-tarjan"
+        return "paige-tarjan"
     else:
-        algo = "naive"
-    args = [binary, "bisimilarity", "-b", "-a", algo, LTS_FILE_NAME]
-    result = subprocess.run(args, stdout=subprocess.PIPE)
-    result = result.stdout.decode("utf-8")
-    #todo maybe check if both bisimilarities are equal
-    pattern = r"took (\d+\.?\d*\S*)"
+        return "naive"
 
-    match = re.search(pattern, result)
-    if match is None:
-        raise ValueError("regex didnt match" + result)
+def cache_key(binary: str, states: int, transitions: int, pt: bool) -> str:
+    # the binary's resolved path and mtime invalidate old results whenever ccs is
+    # rebuilt (files in the nix store all have mtime 1, but a new store path)
+    version = f"{os.path.realpath(binary)}:{os.path.getmtime(binary)}"
+    sampling = f"{SAMPLE_BUDGET}:{TARGET_REL_STDERR}:{MIN_SAMPLES}:{MAX_SAMPLES}"
+    return f"{version}:{algorithm_name(pt)}:{sampling}:{states}:{transitions}"
+
+def load_cache() -> dict:
+    if not os.path.exists(CACHE_FILE_NAME):
+        return {}
+    try:
+        with open(CACHE_FILE_NAME, "r") as read:
+            return json.load(read)
+    except json.JSONDecodeError:
+        print(f"ignoring corrupt cache {CACHE_FILE_NAME}", file=sys.stderr)
+        return {}
+
+def save_cache(cache: dict):
+    # write a sibling file and swap it in, so an interrupted write never
+    # leaves a truncated cache behind
+    directory = os.path.dirname(os.path.abspath(CACHE_FILE_NAME))
+    write = tempfile.NamedTemporaryFile("w", dir=directory, prefix=".benchmark_cache-", delete=False)
+    try:
+        with write:
+            json.dump(cache, write)
+        os.replace(write.name, CACHE_FILE_NAME)
+    except BaseException:
+        os.remove(write.name)
+        raise
+
+def start_server(binary: str) -> subprocess.Popen:
+    return subprocess.Popen([binary, "server"], stdin=subprocess.PIPE, stdout=subprocess.PIPE, encoding="utf-8")
+
+def stop_server(server: subprocess.Popen):
+    # a server that already died leaves unflushed input behind, which makes
+    # close() fail; it still has to be reaped
+    try:
+        server.stdin.close()
+    except OSError:
+        server.kill()
+    server.wait()
 
-    pt_time = parse_time(match.group(1))
+def server_command(server: subprocess.Popen, args: list[str]) -> str:
+    # the server reads one command per line and splits its arguments at tabs
+    if any("\t" in arg or "\n" in arg for arg in args):
+        raise ValueError("server arguments must not contain tabs or newlines: " + repr(args))
 
-    os.remove(LTS_FILE_NAME)
+    server.stdin.write("\t".join(args) + "\n")
+    server.stdin.flush()
 
-    return pt_time
+    output = []
+    for line in server.stdout:
+        if line.startswith(SERVER_DONE):
+            if line.split() != [SERVER_DONE, "ok"]:
+                raise ValueError("server command failed: " + " ".join(args))
+            return "".join(output)
+        output.append(line)
 
-def parse_time(time:str) -> float:
-    nano = re.match(r"(\d+\.?\d+)ns", time)
-    if not nano is None:
-        return float(nano.group(1)) * 1e-9
+    raise ValueError("server exited unexpectedly")
 
-    micro = re.match(r"(\d+\.?\d+)µs", time)
-    if not micro is None:
-        return float(micro.group(1)) * 1e-6
+def measure_time(binary: str, server: subprocess.Popen, states: int, transitions: int, pt: bool) -> tuple[float, float, int, float | None]:
+    algo = algorithm_name(pt)
 
-    milli = re.match(r"(\d+\.?\d+)ms", time)
-    if not milli is None:
-        return float(milli.group(1)) * 1e-3
+    # generate the LTS once and let every sample of this cell solve the same one
+    gen_args = [binary, "random-lts", "-s", str(states), "-t", str(transitions), "-a", "1"]
+    lts_file = tempfile.NamedTemporaryFile("w", prefix="benchmark-", suffix=".ccs", delete=False)
+    try:
+        with lts_file:
+            subprocess.run(gen_args, stdout=lts_file, check=True)
 
-    seconds = re.match(r"(\d+\.?\d+)s", time)
-    if not seconds is None:
-        return float(seconds.group(1))
+        # the first run only warms up caches and is thrown away
+        sample_time(server, lts_file.name, algo)
 
-    raise ValueError("unexpected time format " + time)
+        times = []
+        mean = 0.0
+        m2 = 0.0
+        rel_stderr = math.inf
+        start = time.monotonic()
+        while len(times) < MAX_SAMPLES \
+                and (len(times) < MIN_SAMPLES or rel_stderr > TARGET_REL_STDERR) \
+                and (len(times) == 0 or time.monotonic() - start < SAMPLE_BUDGET):
+            sample = sample_time(server, lts_file.name, algo)
+            times.append(sample)
+
+            # Welford's online algorithm for mean and variance
+            delta = sample - mean
+            mean += delta / len(times)
+            m2 += delta * (sample - mean)
+            if len(times) > 1 and mean > 0:
+                rel_stderr = math.sqrt(m2 / (len(times) - 1) / len(times)) / mean
+    finally:
+        os.remove(lts_file.name)
+
+    median = statistics.median(times)
+    mad = statistics.median(abs(t - median) for t in times)
+
+    # inf is not valid JSON, report an unknown error as null instead
+    return (median, mad, len(times), rel_stderr if math.isfinite(rel_stderr) else None)
+
+def sample_time(server: subprocess.Popen, lts_file_name: str, algo: str) -> float:
+    result = server_command(server, ["bisimilarity", "-b", "-a", algo, lts_file_name])
+    #todo maybe check if both bisimilarities are equal
+    match = TOOK_REGEX.search(result)
+    if match is None:
+        raise ValueError("regex didnt match" + result)
+
+    return parse_time(match.group(1))
+
+def parse_time(time: str) -> float:
+    match = TIME_REGEX.match(time)
+    if match is None:
+        raise ValueError("unexpected time format " + time)
+
+    return float(match.group(1)) * TIME_UNITS[match.group(2)]
 
 
 def usage():
     print("Usage:");
-    print(f"  {sys.argv[0]} [binary] [step_width] [nsteps]");
+    print(f"  {sys.argv[0]} [--no-cache] [--resume] [--mode grid|slices] [binary] [step_width] [nsteps]");
     pass
 
 def main():
     binary = "./target/release/ccs"
     step_width = 100000
     nsteps = 10
-    outfile = "benchmark.json"
+    outfile = "benchmark.ndjson"
 
     if "-h" in sys.argv or "--help" in sys.argv or "help" in sys.argv:
         usage()
         return
 
-    if len(sys.argv) > 1:
-        binary = sys.argv[1]
-    if len(sys.argv) > 2:
-        step_width = int(sys.argv[2])
-    if len(sys.argv) > 3:
-        nsteps = int(sys.argv[3])
+    use_cache = "--no-cache" not in sys.argv
+    resume = "--resume" in sys.argv
+    args = [arg for arg in sys.argv[1:] if arg not in ("--no-cache", "--resume")]
+
+    mode = "grid"
+    if "--mode" in args:
+        i = args.index("--mode")
+        mode = args[i + 1] if i + 1 < len(args) else None
+        del args[i:i + 2]
+    if mode not in MODES:
+        usage()
+        return
+
+    if len(args) > 0:
+        binary = args[0]
+    if len(args) > 1:
+        step_width = int(args[1])
+    if len(args) > 2:
+        nsteps = int(args[2])
 
-    print(f"Benchmarking {binary} with {nsteps} steps of width {step_width}")
+    print(f"Benchmarking {binary} with {nsteps} steps of width {step_width} ({mode}, {WORKERS} workers)")
+
+    if mode == "slices":
+        cells = slice_cells(step_width, nsteps)
+    else:
+        cells = grid_cells(step_width, nsteps)
 
-    data = bench(binary, step_width, nsteps, USE_PAIGE_TARJAN)
+    if resume:
+        done = {(row[0], row[1]) for row in load_results(outfile)}
+        cells = [c for c in cells if c not in done]
+        print(f"resuming with {len(done)} cells already in {outfile}", file=sys.stderr)
 
-    with open(outfile, "w") as write:
-        json.dump(data, write)
+    cache = load_cache() if use_cache else None
+    with open(outfile, "a" if resume else "w") as write:
+        bench(binary, cells, USE_PAIGE_TARJAN, write, cache)
         print(f"written data to {outfile}", file=sys.stderr)
 
 if __name__ == '__main__':
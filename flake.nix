@@ -12,7 +12,7 @@
     inherit (nixpkgs) lib;
     pkgs = nixpkgs.legacyPackages.${system};
     craneLib = crane.mkLib pkgs;
-    benchmarkPythonEnv = pkgs.python3.withPackages(ps: [ ps.matplotlib ]);
+    benchmarkPythonEnv = pkgs.python3.withPackages(ps: [ ps.matplotlib ps.numpy ]);
     srcFilter = path: type: (builtins.match ".*pest$" path != null) || (builtins.match ".*ccs$" path != null) || (craneLib.filterCargoSources path type);
     filteredSrc = lib.cleanSourceWith {
       src = ./.;
@@ -2,22 +2,30 @@ import json
 import os
 import sys
 
+import matplotlib
+import numpy as np
+
+# only the interactive 3D view needs a GUI backend
+if "show" not in sys.argv:
+    matplotlib.use("Agg")
+
 import matplotlib.pyplot as plt
 
 OUTDIR = "figures"
 
+def save(fig, filename: str):
+    fig.savefig(f"{OUTDIR}/{filename}.svg")
+    fig.savefig(f"{OUTDIR}/{filename}.png")
+
 def unzip(data):
-    x_coordinates = [x for (x, _, _) in data]
-    y_coordinates = [y for (_, y, _) in data]
-    times = [t for (_, _, t) in data]
-    return (x_coordinates, y_coordinates, times)
+    return (data[:, 0], data[:, 1], data[:, 2], data[:, 3])
 
 
 def render_3d(data, show=False):
     fig = plt.figure()
     ax = fig.add_subplot(projection='3d')
 
-    x_coordinates, y_coordinates, times = unzip(data)
+    x_coordinates, y_coordinates, times, _ = unzip(data)
     ax.scatter(x_coordinates, y_coordinates, times, marker = 'o')
 
     ax.set_xlabel("number of states")
@@ -25,67 +33,72 @@ def render_3d(data, show=False):
     ax.set_zlabel("time in seconds")
     ax.set_zlim(bottom=0)
 
-    plt.savefig(f"{OUTDIR}/bench3d.svg");
-    plt.savefig(f"{OUTDIR}/bench3d.png");
+    save(fig, "bench3d")
 
     if show:
         plt.show()
+    plt.close(fig)
 
 def render_states(filename: str, transitions: int, data):
     fig = plt.figure()
     ax = fig.add_subplot()
 
-    low_data = [(st, tr, ti) for (st, tr, ti) in data if tr == transitions]
+    low_data = data[data[:, 1] == transitions]
 
-    x_coordinates, _, times = unzip(low_data)
-    ax.plot(x_coordinates, times, marker = 'o')
+    x_coordinates, _, times, deviations = unzip(low_data)
+    ax.errorbar(x_coordinates, times, yerr=deviations, marker = 'o')
 
     ax.set_xlabel(f"number of states ({transitions} transitions)")
     ax.set_ylabel("time in seconds")
     ax.set_ylim(bottom=0)
 
-    plt.savefig(f"{OUTDIR}/{filename}.svg");
-    plt.savefig(f"{OUTDIR}/{filename}.png");
+    save(fig, filename)
+    plt.close(fig)
 
 def render_transitions(filename: str, states: int, data):
     fig = plt.figure()
     ax = fig.add_subplot()
 
-    low_data = [(st, tr, ti) for (st, tr, ti) in data if st == states]
+    low_data = data[data[:, 0] == states]
 
-    _, x_coordinates, times = unzip(low_data)
-    ax.plot(x_coordinates, times, marker = 'o')
+    _, x_coordinates, times, deviations = unzip(low_data)
+    ax.errorbar(x_coordinates, times, yerr=deviations, marker = 'o')
 
     ax.set_xlabel(f"number of transitions ({states} states)")
     ax.set_ylabel("time in seconds")
     ax.set_ylim(bottom=0)
 
-    plt.savefig(f"{OUTDIR}/{filename}.svg");
-    plt.savefig(f"{OUTDIR}/{filename}.png");
+    save(fig, filename)
+    plt.close(fig)
 
 def render_ratio(filename: str, rstates: int, rtransitions: int, data):
     fig = plt.figure()
     ax = fig.add_subplot()
 
-    low_data = [(st, tr, ti) for (st, tr, ti) in data if rstates * st == rtransitions * tr]
+    low_data = data[rstates * data[:, 0] == rtransitions * data[:, 1]]
 
-    x_coordinates, _, times = unzip(low_data)
-    ax.plot(x_coordinates, times, marker = 'o')
+    x_coordinates, _, times, deviations = unzip(low_data)
+    ax.errorbar(x_coordinates, times, yerr=deviations, marker = 'o')
 
     ax.set_xlabel(f"number of states ({rstates}:{rtransitions} states to transitions)")
     ax.set_ylabel("time in seconds")
     ax.set_ylim(bottom=0)
 
-    plt.savefig(f"{OUTDIR}/{filename}.svg");
-    plt.savefig(f"{OUTDIR}/{filename}.png");
+    save(fig, filename)
+    plt.close(fig)
 
 def main():
-    infile = "benchmark.json"
+    infile = "benchmark.ndjson"
 
     with open(infile, "r") as read:
-        data = json.load(read)
+        data = np.asarray([json.loads(line) for line in read if line.strip()], dtype=float)
         print(f"read data from {infile}", file=sys.stderr)
 
+    # rows are written in completion order, but the line plots need them sorted
+    data = data[np.lexsort((data[:, 1], data[:, 0]))]
+    s_min, s_max = int(data[:, 0].min()), int(data[:, 0].max())
+    t_min, t_max = int(data[:, 1].min()), int(data[:, 1].max())
+
     print(data)
 
     if not os.path.exists(OUTDIR):
@@ -94,12 +107,12 @@ def main():
     render_3d(data, "show" in sys.argv )
     if "show" in sys.argv:
         return
-    render_states("states_low", data[0][1], data)
-    render_states("states_high", data[len(data) - 1][1], data)
-    render_states("states_med", data[len(data) -1][1] // 2, data)
-    render_transitions("transitions_low", data[0][0], data)
-    render_transitions("transitions_high", data[len(data) - 1][0], data)
-    render_transitions("transitions_med", data[len(data) -1][0] // 2, data)
+    render_states("states_low", t_min, data)
+    render_states("states_high", t_max, data)
+    render_states("states_med", t_max // 2, data)
+    render_transitions("transitions_low", s_min, data)
+    render_transitions("transitions_high", s_max, data)
+    render_transitions("transitions_med", s_max // 2, data)
     render_ratio("1to1", 1, 1, data)
     render_ratio("2to1", 2, 1, data)
     render_ratio("1to2", 1, 2, data)
@@ -1,5 +1,8 @@
 use std::fs;
 use std::io;
+use std::io::BufRead;
+use std::io::Write;
+use std::iter;
 use std::process;
 use std::rc::Rc;
 
@@ -22,6 +25,9 @@ mod error;
 #[cfg(test)]
 mod tests;
 
+/// Prefix of the line that terminates the output of each command in server mode
+const SERVER_DONE: &str = "%done";
+
 #[derive(clap::Parser, Debug)]
 #[command(version, about, long_about = None)]
 struct Args {
@@ -127,7 +133,13 @@ enum Subcommand {
         /// Number of transitions
         #[clap(short, long)]
         transitions: usize,
-    }
+    },
+
+    /// Execute commands read line by line from stdin in a single process
+    ///
+    /// Each line holds the tab separated arguments of one of the other subcommands.
+    /// Its output is terminated by a line "%done ok" or "%done error".
+    Server,
 }
 
 #[derive(Clone, Copy, ValueEnum, PartialEq, Eq, Debug)]
@@ -319,11 +331,45 @@ fn bisimilarity(file: String, other_file: Option<String>, algorithm_choice: Exte
     Ok(())
 }
 
-fn main() {
-    let args = Args::parse();
+fn server() -> CCSResult<()> {
+    serve(io::stdin().lock(), &mut io::stdout())
+}
 
+/// Run the commands from `input` and write a status line for each of them to `status`
+///
+/// Only the status lines go to `status`, the commands themselves still print to stdout.
+/// `status` therefore has to be stdout for a command's output to precede its status line.
+fn serve(input: impl BufRead, status: &mut impl Write) -> CCSResult<()> {
+    for line in input.lines() {
+        let line = line.map_err(CCSError::file_error)?;
+        // arguments are separated by tabs, so paths may contain spaces
+        let words = iter::once("ccs").chain(line.split('\t'));
+
+        let result = match Args::try_parse_from(words) {
+            Ok(Args { subcommand: Subcommand::Server }) => {
+                eprintln!("Server Error: nested server mode is not supported");
+                Err(())
+            },
+            Ok(args) => run(args.subcommand).map_err(|e| eprintln!("{}", e)),
+            Err(e) => {
+                eprintln!("{}", e);
+                Err(())
+            },
+        };
+
+        let result = if result.is_ok() { "ok" } else { "error" };
+        writeln!(status, "{} {}", SERVER_DONE, result)
+            .map_err(CCSError::file_error)?;
+        status.flush()
+            .map_err(CCSError::file_error)?;
+    }
+
+    Ok(())
+}
+
+fn run(subcommand: Subcommand) -> CCSResult<()> {
     use Subcommand::*;
-    let result = match args.subcommand {
+    match subcommand {
         Lts { file, graph, x11, compare, allow_duplicates } => lts(file, compare, graph, x11, allow_duplicates),
         Parse { file } => parse(file),
         States { file, allow_duplicates } => states(file, allow_duplicates),
@@ -331,7 +377,11 @@ fn main() {
         Trace { file, allow_duplicates } => trace(file, allow_duplicates),
         RandomLts { states, actions, transitions } => random(states, actions, transitions),
         Bisimilarity { file, bench, relation, algorithm, other_file } => bisimilarity(file, other_file, algorithm, bench, relation),
-    };
+        Server => server(),
+    }
+}
 
-    error::resolve(result);
+fn main() {
+    let args = Args::parse();
+    error::resolve(run(args.subcommand));
 }
@@ -1,5 +1,6 @@
 mod parsing;
 mod bisimilarity;
+mod server;
 
 /// Test examples, excluding large bisimulation examples
 const EXAMPLES: &[&str] = &[
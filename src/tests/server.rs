@@ -0,0 +1,31 @@
+use crate::serve;
+
+/// Only the status lines are captured, the commands' own output goes to stdout
+fn status_lines(input: &str) -> Vec<String> {
+    let mut status = Vec::new();
+    serve(input.as_bytes(), &mut status).unwrap();
+    String::from_utf8(status).unwrap()
+        .lines()
+        .map(str::to_string)
+        .collect()
+}
+
+#[test]
+fn server_terminates_every_command() {
+    let input = "parse\texamples/disconnected.ccs\n\
+                 parse\texamples/does-not-exist.ccs\n\
+                 no-such-subcommand\n\
+                 server\n";
+    assert_eq!(status_lines(input), ["%done ok", "%done error", "%done error", "%done error"]);
+}
+
+#[test]
+fn server_splits_arguments_at_tabs() {
+    // a space is part of the argument, so this names a file that does not exist
+    assert_eq!(status_lines("parse\texamples/disconnected.ccs \n"), ["%done error"]);
+}
+
+#[test]
+fn server_without_commands() {
+    assert!(status_lines("").is_empty());
+}